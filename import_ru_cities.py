@@ -7,8 +7,15 @@ Usage:
 """
 
 import os
+import io
+import sys
 import csv
+import orjson
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http import HTTPStatus
 from pathlib import Path
 
 SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
@@ -20,21 +27,46 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
+# Shared session: keeps TCP/TLS connections to Supabase alive between calls
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5),
+))
+
+INSERT_URL = f"{SUPABASE_URL}/rest/v1/cities?on_conflict=name"
+INSERT_HEADERS = {"Prefer": "resolution=ignore-duplicates,return=minimal"}
+INSERT_CSV_HEADERS = {**INSERT_HEADERS, "Content-Type": "text/csv; charset=utf-8"}
+
+CSV_PATH = Path(__file__).parent / "ru.csv"
+
 # Cities to skip (already added)
 SKIP_CITIES = {"Moscow", "Voronezh"}
 
+# Max cities per insert request (keeps body size within limits)
+CHUNK_SIZE = 500
+# Max names per name=in.(...) lookup (keeps URL length within limits)
+LOOKUP_CHUNK_SIZE = 200
+# Parallel single-row inserts when the bulk insert is rejected
+MAX_WORKERS = 16
+# Statuses meaning the array body itself was refused (not auth, rate limit, ...)
+BULK_REJECTED_STATUSES = frozenset({HTTPStatus.BAD_REQUEST, HTTPStatus.REQUEST_ENTITY_TOO_LARGE})
+# Per-city output lines are written to stdout in batches of this size
+OUTPUT_FLUSH_EVERY = 500
+
 
 def get_or_create_russia() -> int:
     """Get Russia country ID, create if not exists."""
     # Try to find Russia
-    resp = requests.get(
+    resp = _SESSION.get(
         f"{SUPABASE_URL}/rest/v1/countries",
-        headers=HEADERS,
         params={"code": "eq.RU", "select": "id"},
         timeout=15,
     )
     resp.raise_for_status()
-    countries = resp.json()
+    countries = orjson.loads(resp.content)
 
     if countries:
         print(f"✅ Found Russia in database (id={countries[0]['id']})")
@@ -42,71 +74,169 @@ def get_or_create_russia() -> int:
 
     # Create Russia
     print("📍 Creating Russia in countries table...")
-    resp = requests.post(
+    resp = _SESSION.post(
         f"{SUPABASE_URL}/rest/v1/countries",
-        headers=HEADERS,
-        json={"name": "Russia", "code": "RU", "active": False},  # inactive by default
+        headers={"Prefer": "return=representation"},  # need the new id
+        data=orjson.dumps({"name": "Russia", "code": "RU", "active": False}),  # inactive by default
         timeout=15,
     )
     resp.raise_for_status()
-    created = resp.json()
+    created = orjson.loads(resp.content)
     print(f"✅ Created Russia (id={created[0]['id']})")
     return created[0]["id"]
 
 
+def _chunks(items: list, size: int):
+    """Yield successive slices of ``items`` of at most ``size`` elements."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _quote(name: str) -> str:
+    """Quote a value for a PostgREST ``in.(...)`` filter."""
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def get_existing_names(names: list[str]) -> set[str]:
+    """Return the subset of ``names`` already present in the cities table."""
+    existing = set()
+    for chunk in _chunks(names, LOOKUP_CHUNK_SIZE):
+        resp = _SESSION.get(
+            f"{SUPABASE_URL}/rest/v1/cities",
+            params={"name": "in.(" + ",".join(_quote(n) for n in chunk) + ")", "select": "name"},
+            timeout=15,
+        )
+        resp.raise_for_status()
+        existing.update(row["name"] for row in orjson.loads(resp.content))
+    return existing
+
+
+def _cities_csv(chunk: list[dict]) -> bytes:
+    """Encode city rows as a CSV body matching the cities table columns."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(("name", "country_id", "lat", "lon", "active"))
+    writer.writerows(
+        (c["name"], c["country_id"], c["lat"], c["lon"], "true" if c["active"] else "false")
+        for c in chunk
+    )
+    return buf.getvalue().encode("utf-8")
+
+
+def insert_cities(chunk: list[dict]) -> None:
+    """Bulk-insert cities as a CSV body, falling back to a JSON array."""
+    resp = _SESSION.post(
+        INSERT_URL,
+        headers=INSERT_CSV_HEADERS,
+        data=_cities_csv(chunk),
+        timeout=60,
+    )
+    if resp.status_code == HTTPStatus.UNSUPPORTED_MEDIA_TYPE:
+        # CSV bodies not accepted by this project — send JSON instead
+        resp = _SESSION.post(INSERT_URL, headers=INSERT_HEADERS, data=orjson.dumps(chunk), timeout=60)
+    resp.raise_for_status()
+
+
+def insert_city(city: dict) -> None:
+    """Insert a single city."""
+    resp = _SESSION.post(INSERT_URL, headers=INSERT_HEADERS, data=orjson.dumps(city), timeout=15)
+    resp.raise_for_status()
+
+
+def _bulk_rejected(exc: requests.HTTPError) -> bool:
+    """True if the bulk POST failed because the array body was refused."""
+    return exc.response is not None and exc.response.status_code in BULK_REJECTED_STATUSES
+
+
+def _insert_each(chunk: list[dict], out: list[str]) -> list[dict]:
+    """Insert cities one by one in parallel. Returns the inserted cities."""
+    inserted = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(insert_city, city): city for city in chunk}
+        for future in as_completed(futures):
+            city = futures[future]
+            try:
+                future.result()
+            except Exception as exc:
+                _log(out, f"  ❌ {city['name']:25s} — {exc}")
+                continue
+            inserted.append(city)
+    return inserted
+
+
+def _flush(out: list[str]) -> None:
+    """Write buffered output lines to stdout in one call."""
+    sys.stdout.write("".join(out))
+    out.clear()
+
+
+def _log(out: list[str], line: str) -> None:
+    """Buffer an output line, flushing every OUTPUT_FLUSH_EVERY lines."""
+    out.append(line + "\n")
+    if len(out) >= OUTPUT_FLUSH_EVERY:
+        _flush(out)
+
+
 def import_cities(csv_path: str, country_id: int) -> tuple[int, int]:
     """Import cities from CSV. Returns (success_count, skipped_count)."""
     success = 0
     skipped = 0
+    out: list[str] = []
 
-    with open(csv_path, 'r', encoding='iso-8859-1') as f:
-        reader = csv.DictReader(f, delimiter=';')
-
-        for row in reader:
-            city_name = row['city'].strip()
+    try:
+        with open(csv_path, 'r', encoding='iso-8859-1') as f:
+            reader = csv.reader(f, delimiter=';')
+            header = next(reader)
+            ci, li, gi = header.index('city'), header.index('lat'), header.index('lng')
+            rows = [(r[ci].strip(), float(r[li]), float(r[gi])) for r in reader if r]
 
+        candidates = []
+        for city_name, lat, lng in rows:
             # Skip already added cities
             if city_name in SKIP_CITIES:
-                print(f"  ⏭️  {city_name:25s} — already added, skipping")
+                _log(out, f"  ⏭️  {city_name:25s} — already added, skipping")
                 skipped += 1
                 continue
 
-            lat = float(row['lat'])
-            lng = float(row['lng'])
+            candidates.append((city_name, lat, lng))
 
-            # Check if city already exists
-            check_resp = requests.get(
-                f"{SUPABASE_URL}/rest/v1/cities",
-                headers=HEADERS,
-                params={"name": f"eq.{city_name}", "select": "id"},
-                timeout=15,
-            )
-            check_resp.raise_for_status()
+        # Check which cities already exist (one request per chunk)
+        existing = get_existing_names([name for name, _, _ in candidates])
 
-            if check_resp.json():
-                print(f"  ⏭️  {city_name:25s} — already exists, skipping")
+        payload = []
+        for city_name, lat, lng in candidates:
+            if city_name in existing:
+                _log(out, f"  ⏭️  {city_name:25s} — already exists, skipping")
                 skipped += 1
                 continue
+            existing.add(city_name)  # guard against duplicates inside the CSV
+            payload.append({
+                "name": city_name,
+                "country_id": country_id,
+                "lat": lat,
+                "lon": lng,
+                "active": False,  # inactive by default
+            })
 
-            # Insert city
+        # Bulk insert: one request per chunk
+        for chunk in _chunks(payload, CHUNK_SIZE):
             try:
-                resp = requests.post(
-                    f"{SUPABASE_URL}/rest/v1/cities",
-                    headers=HEADERS,
-                    json={
-                        "name": city_name,
-                        "country_id": country_id,
-                        "lat": lat,
-                        "lon": lng,
-                        "active": False,  # inactive by default
-                    },
-                    timeout=15,
-                )
-                resp.raise_for_status()
-                print(f"  ✅ {city_name:25s} ({lat:.4f}, {lng:.4f})")
-                success += 1
-            except Exception as exc:
-                print(f"  ❌ {city_name:25s} — {exc}")
+                insert_cities(chunk)
+                inserted = chunk
+            except requests.HTTPError as exc:
+                # Bulk/array POSTs disabled — insert row by row; anything else is fatal
+                if not _bulk_rejected(exc):
+                    raise
+                _log(out, f"  ⚠️  Bulk insert of {len(chunk)} cities rejected ({exc}), inserting one by one")
+                inserted = _insert_each(chunk, out)
+
+            for city in inserted:
+                _log(out, f"  ✅ {city['name']:25s} ({city['lat']:.4f}, {city['lon']:.4f})")
+            success += len(inserted)
+    finally:
+        # Write buffered lines even if a Supabase call fails midway
+        _flush(out)
+        sys.stdout.flush()
 
     return success, skipped
 
@@ -117,9 +247,8 @@ def main():
         print("   Set them as environment variables.")
         return
 
-    csv_path = Path(__file__).parent / "ru.csv"
-    if not csv_path.exists():
-        print(f"❌ File not found: {csv_path}")
+    if not CSV_PATH.exists():
+        print(f"❌ File not found: {CSV_PATH}")
         return
 
     print("🇷🇺 Importing Russian cities from ru.csv")
@@ -132,7 +261,7 @@ def main():
     print("─" * 60)
 
     # Import cities
-    success, skipped = import_cities(str(csv_path), country_id)
+    success, skipped = import_cities(str(CSV_PATH), country_id)
 
     print("─" * 60)
     print(f"✅ Done: {success} cities added, {skipped} skipped")
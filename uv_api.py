@@ -11,115 +11,172 @@ Example:
 from __future__ import annotations
 
 import argparse
-import json
+import time
 from http import HTTPStatus
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from urllib.parse import parse_qs, urlparse
 
-from uv_india import DEFAULT_CITY, fetch_uv, get_uv, save
+import aiohttp
+import orjson
+from aiohttp import web
 
-OPS = {
-    "gte": lambda uv, threshold: uv >= threshold,
-    "gt": lambda uv, threshold: uv > threshold,
-    "lte": lambda uv, threshold: uv <= threshold,
-    "lt": lambda uv, threshold: uv < threshold,
-    "eq": lambda uv, threshold: uv == threshold,
+from uv_india import DEFAULT_CITY, fetch_uv, get_uv, refresh_cache, resolve_city, upsert_uv_data_async
+
+_VALID_OPS = frozenset({"gte", "gt", "lte", "lt", "eq"})
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
 }
 
+# Cached get_uv results: city -> (expiry_epoch, payload)
+UV_CACHE_TTL = 60
+_UV_CACHE: dict[str, tuple[float, dict]] = {}
 
-class UVHandler(BaseHTTPRequestHandler):
-    def _send_json(self, payload: dict, status: HTTPStatus = HTTPStatus.OK) -> None:
-        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-
-        self.send_response(status.value)
-        self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.send_header("Content-Length", str(len(body)))
-        self.end_headers()
-        self.wfile.write(body)
-
-    def do_OPTIONS(self) -> None:
-        self.send_response(HTTPStatus.NO_CONTENT.value)
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.end_headers()
-
-    def do_GET(self) -> None:
-        parsed = urlparse(self.path)
-
-        if parsed.path == "/health":
-            self._send_json({"ok": True})
-            return
-
-        if parsed.path != "/banner/uv":
-            self._send_json({"ok": False, "error": "Not found"}, status=HTTPStatus.NOT_FOUND)
-            return
-
-        query = parse_qs(parsed.query)
-        city = query.get("city", [DEFAULT_CITY])[0]
-        op = query.get("op", ["gte"])[0].lower()
-        fresh = query.get("fresh", ["0"])[0] in {"1", "true", "True", "yes"}
-
-        try:
-            threshold = float(query.get("threshold", ["6"])[0])
-        except ValueError:
-            self._send_json(
-                {"ok": False, "error": "Invalid threshold. Use number, e.g. threshold=6"},
-                status=HTTPStatus.BAD_REQUEST,
-            )
-            return
 
-        if op not in OPS:
-            self._send_json(
+def _cache_key(city: str) -> str:
+    return city.strip().lower()
+
+
+def _cache_get(city: str) -> dict | None:
+    entry = _UV_CACHE.get(_cache_key(city))
+    if entry and entry[0] > time.time():
+        return entry[1]
+    return None
+
+
+def _cache_put(city: str, payload: dict) -> None:
+    _UV_CACHE[_cache_key(city)] = (time.time() + UV_CACHE_TTL, payload)
+
+
+def _json(payload: dict, status: HTTPStatus = HTTPStatus.OK) -> web.Response:
+    return web.Response(
+        body=orjson.dumps(payload),
+        status=status.value,
+        headers=CORS_HEADERS,
+        content_type="application/json",
+        charset="utf-8",
+    )
+
+
+async def _load_uv(session: aiohttp.ClientSession, city: str, fresh: bool) -> dict | None:
+    """Return stored UV data, fetching from Open-Meteo when missing or fresh=1."""
+    if not fresh:
+        latest = await get_uv(session, city)
+        if latest:
+            return latest
+    else:
+        # Forced refresh also re-reads the city itself (renames, new coordinates)
+        refresh_cache(city)
+
+    row = await resolve_city(session, city)
+    if row is None:
+        return None
+    data = await fetch_uv(session, row["name"], row["lat"], row["lon"])
+    await upsert_uv_data_async(session, row["id"], data)
+    return {**data, "city": row["name"]}
+
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler) -> web.StreamResponse:
+    if request.method == "OPTIONS":
+        return web.Response(status=HTTPStatus.NO_CONTENT.value, headers=CORS_HEADERS)
+    try:
+        return await handler(request)
+    except web.HTTPNotFound:
+        return _json({"ok": False, "error": "Not found"}, status=HTTPStatus.NOT_FOUND)
+
+
+async def health(request: web.Request) -> web.Response:
+    return _json({"ok": True})
+
+
+async def banner(request: web.Request) -> web.Response:
+    query = request.query
+    city = query.get("city", DEFAULT_CITY)
+    op = query.get("op", "gte").lower()
+    fresh = query.get("fresh", "0") in {"1", "true", "True", "yes"}
+
+    try:
+        threshold = float(query.get("threshold", "6"))
+    except ValueError:
+        return _json(
+            {"ok": False, "error": "Invalid threshold. Use number, e.g. threshold=6"},
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    if op not in _VALID_OPS:
+        return _json(
+            {"ok": False, "error": "Invalid op. Use one of: gte, gt, lte, lt, eq"},
+            status=HTTPStatus.BAD_REQUEST,
+        )
+
+    try:
+        latest = None if fresh else _cache_get(city)
+        if latest is None:
+            latest = await _load_uv(request.app["session"], city, fresh)
+            if latest is None:
+                return _json(
+                    {"ok": False, "error": f"City '{city}' not found"},
+                    status=HTTPStatus.NOT_FOUND,
+                )
+            _cache_put(city, latest)
+    except Exception as exc:  # pragma: no cover
+        return _json(
+            {"ok": False, "error": str(exc)},
+            status=HTTPStatus.BAD_GATEWAY,
+        )
+
+    uv_value = float(latest.get("uv_index", 0))
+    match op:
+        case "gte":
+            is_triggered = uv_value >= threshold
+        case "gt":
+            is_triggered = uv_value > threshold
+        case "lte":
+            is_triggered = uv_value <= threshold
+        case "lt":
+            is_triggered = uv_value < threshold
+        case "eq":
+            is_triggered = uv_value == threshold
+        case _:
+            return _json(
                 {"ok": False, "error": "Invalid op. Use one of: gte, gt, lte, lt, eq"},
                 status=HTTPStatus.BAD_REQUEST,
             )
-            return
-
-        try:
-            if fresh:
-                latest = fetch_uv(city)
-                save(latest)
-            else:
-                latest = get_uv(city)
-                if not latest:
-                    latest = fetch_uv(city)
-                    save(latest)
-        except Exception as exc:  # pragma: no cover
-            self._send_json(
-                {"ok": False, "error": str(exc)},
-                status=HTTPStatus.BAD_GATEWAY,
-            )
-            return
-
-        uv_value = float(latest.get("uv_index", 0))
-        is_triggered = OPS[op](uv_value, threshold)
-
-        self._send_json(
-            {
-                "ok": True,
-                "city": latest.get("city", city),
-                "timestamp": latest.get("timestamp"),
-                "uv_index": uv_value,
-                "uv_desc": latest.get("uv_desc"),
-                "trigger": {
-                    "op": op,
-                    "threshold": threshold,
-                    "matched": is_triggered,
-                },
-                "banner_payload": {
-                    "uv": uv_value,
-                    "show_uv_creative": is_triggered,
-                },
-            }
-        )
 
-    def log_message(self, fmt: str, *args) -> None:
-        # Keep console clean for local testing
-        return
+    return _json(
+        {
+            "ok": True,
+            "city": latest.get("city", city),
+            "timestamp": latest.get("timestamp"),
+            "uv_index": uv_value,
+            "uv_desc": latest.get("uv_desc"),
+            "trigger": {
+                "op": op,
+                "threshold": threshold,
+                "matched": is_triggered,
+            },
+            "banner_payload": {
+                "uv": uv_value,
+                "show_uv_creative": is_triggered,
+            },
+        }
+    )
+
+
+async def _client_session(app: web.Application):
+    # One upstream session shared by all requests (Supabase + Open-Meteo)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+        app["session"] = session
+        yield
+
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[cors_middleware])
+    app.cleanup_ctx.append(_client_session)
+    app.router.add_get("/health", health)
+    app.router.add_get("/banner/uv", banner)
+    return app
 
 
 def main() -> None:
@@ -128,9 +185,9 @@ def main() -> None:
     parser.add_argument("--port", type=int, default=8080)
     args = parser.parse_args()
 
-    server = ThreadingHTTPServer((args.host, args.port), UVHandler)
     print(f"UV API listening on http://{args.host}:{args.port}")
-    server.serve_forever()
+    # Keep console clean for local testing
+    web.run_app(create_app(), host=args.host, port=args.port, access_log=None, print=None)
 
 
 if __name__ == "__main__":
@@ -10,13 +10,19 @@ Usage:
     python uv_india.py "Mumbai"     # Fetch single city by name
 
 Dependencies:
-    pip install requests
+    pip install requests aiohttp orjson
 """
 
 import sys
 import os
 import time
+import bisect
+import asyncio
+import aiohttp
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime, timezone
 
 SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
@@ -28,6 +34,34 @@ HEADERS = {
     "Content-Type": "application/json",
 }
 
+# Shared session: keeps TCP/TLS connections to Supabase alive between calls
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5),
+))
+
+# Supabase upsert target (request headers are merged with the session's)
+_UPSERT_URL = f"{SUPABASE_URL}/rest/v1/uv_data?on_conflict=city_id"
+_UPSERT_HEADERS = {"Prefer": "resolution=merge-duplicates,return=minimal"}
+# aiohttp sessions carry no Supabase headers, so the async upsert sends the full set
+_UPSERT_HEADERS_FULL = {**HEADERS, **_UPSERT_HEADERS}
+_UV_RPC_URL = f"{SUPABASE_URL}/rest/v1/rpc/get_uv_for_banner"
+
+# Active cities list and by-name lookups are cached for this many seconds
+CITIES_CACHE_TTL = 300
+_CITIES_CACHE = {"t": 0.0, "v": []}
+# Found cities: (lookup kind, lowercased name) -> (timestamp, city); misses are not cached
+_CITY_CACHE: dict[tuple[str, str], tuple[float, dict]] = {}
+
+# City used by the banner API when none is given
+DEFAULT_CITY = "Delhi"
+
+# Max simultaneous cities in flight (keeps Open-Meteo / Supabase load polite)
+CONCURRENCY = 8
+
 
 def supabase_enabled() -> bool:
     return bool(SUPABASE_URL and SUPABASE_KEY)
@@ -38,10 +72,12 @@ def supabase_enabled() -> bool:
 # ============================================================
 
 def get_active_cities() -> list[dict]:
-    """Read active cities from active countries in Supabase."""
-    resp = requests.get(
+    """Read active cities from active countries in Supabase (cached for CITIES_CACHE_TTL)."""
+    if _CITIES_CACHE["v"] and time.time() - _CITIES_CACHE["t"] <= CITIES_CACHE_TTL:
+        return _CITIES_CACHE["v"]
+
+    resp = _SESSION.get(
         f"{SUPABASE_URL}/rest/v1/cities",
-        headers=HEADERS,
         params={
             "active": "eq.true",
             "select": "id,name,lat,lon,countries!inner(name,active)",
@@ -51,25 +87,109 @@ def get_active_cities() -> list[dict]:
         timeout=15,
     )
     resp.raise_for_status()
-    cities = resp.json()
+    cities = orjson.loads(resp.content)
     # Flatten nested country data
     for city in cities:
         city["country"] = city.get("countries", {}).get("name", "Unknown")
         city.pop("countries", None)
+    _CITIES_CACHE["t"] = time.time()
+    _CITIES_CACHE["v"] = cities
     return cities
 
 
+def _cached_city(kind: str, name: str) -> dict | None:
+    entry = _CITY_CACHE.get((kind, name.strip().lower()))
+    if entry and time.time() - entry[0] <= CITIES_CACHE_TTL:
+        return entry[1]
+    return None
+
+
+def _cache_city(kind: str, name: str, city: dict) -> None:
+    _CITY_CACHE[(kind, name.strip().lower())] = (time.time(), city)
+
+
 def get_city_by_name(name: str) -> dict | None:
-    """Find a single city by name (case-insensitive)."""
-    resp = requests.get(
+    """Find a single city by name (case-insensitive, cached for CITIES_CACHE_TTL)."""
+    city = _cached_city("name", name)
+    if city:
+        return city
+
+    resp = _SESSION.get(
         f"{SUPABASE_URL}/rest/v1/cities",
-        headers=HEADERS,
         params={"name": f"ilike.{name.strip()}", "select": "id,name,lat,lon", "limit": "1"},
         timeout=15,
     )
     resp.raise_for_status()
-    rows = resp.json()
-    return rows[0] if rows else None
+    rows = orjson.loads(resp.content)
+    if not rows:
+        return None
+    _cache_city("name", name, rows[0])
+    return rows[0]
+
+
+def _ilike_exact(value: str) -> str:
+    """Escape LIKE wildcards so an ilike filter is a case-insensitive equality."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def resolve_city(session: aiohttp.ClientSession, name: str) -> dict | None:
+    """Find an active city in an active country by name or DSP alias.
+
+    Mirrors the lookup in the get_uv_for_banner RPC: exact case-insensitive
+    match on cities.name, then on city_mapping.dsp_name.
+    """
+    name = name.strip()
+    # PostgREST turns * into % in like patterns and offers no escape for it;
+    # no city name contains one, so such input can never match the RPC either
+    if not name or "*" in name:
+        return None
+
+    city = _cached_city("active", name)
+    if city:
+        return city
+
+    async with session.get(
+        f"{SUPABASE_URL}/rest/v1/cities",
+        headers=HEADERS,
+        params={"name": f"ilike.{_ilike_exact(name)}", "active": "eq.true",
+                "select": "id,name,lat,lon,countries!inner(active)",
+                "countries.active": "eq.true", "limit": "1"},
+        timeout=aiohttp.ClientTimeout(total=15),
+    ) as resp:
+        resp.raise_for_status()
+        rows = await resp.json(loads=orjson.loads)
+
+    if not rows:
+        # Fall back to DSP name mapping (e.g. "Bombay" -> Mumbai)
+        async with session.get(
+            f"{SUPABASE_URL}/rest/v1/city_mapping",
+            headers=HEADERS,
+            params={"dsp_name": f"ilike.{_ilike_exact(name)}",
+                    "select": "cities!inner(id,name,lat,lon,countries!inner(active))",
+                    "cities.active": "eq.true", "cities.countries.active": "eq.true",
+                    "limit": "1"},
+            timeout=aiohttp.ClientTimeout(total=15),
+        ) as resp:
+            resp.raise_for_status()
+            rows = [row["cities"] for row in await resp.json(loads=orjson.loads)]
+
+    if not rows:
+        return None
+    city = rows[0]
+    city.pop("countries", None)
+    _cache_city("active", name, city)
+    return city
+
+
+def refresh_cache(name: str | None = None) -> None:
+    """Drop cached city lookups (one name, or everything) so Supabase is re-read."""
+    if name is not None:
+        for kind in ("name", "active"):
+            _CITY_CACHE.pop((kind, name.strip().lower()), None)
+        return
+    _CITIES_CACHE["t"] = 0.0
+    _CITIES_CACHE["v"] = []
+    _CITY_CACHE.clear()
 
 
 # ============================================================
@@ -103,52 +223,54 @@ WMO_CODES = {
     99: "Thunderstorm with heavy hail",
 }
 
+# UV Index bands: upper bound (inclusive) of each level except the last
+UV_BANDS = (2, 5, 7, 10)
+UV_LABELS = ("Low", "Moderate", "High", "Very High", "Extreme")
 
-def fetch_uv(name: str, lat: float, lon: float, retries: int = 3) -> dict:
-    """Fetch UV Index and weather from Open-Meteo with retry."""
+
+async def fetch_uv(session: aiohttp.ClientSession, name: str, lat: float, lon: float,
+                   retries: int = 3, ts: str | None = None) -> dict:
+    """Fetch UV Index and weather from Open-Meteo with retry.
+
+    ``ts`` is the sample timestamp to record; defaults to the current UTC time.
+    """
     for attempt in range(retries):
         try:
-            resp = requests.get("https://api.open-meteo.com/v1/forecast", params={
+            async with session.get("https://api.open-meteo.com/v1/forecast", params={
                 "latitude": lat,
                 "longitude": lon,
                 "current": "uv_index,temperature_2m,relative_humidity_2m,"
                            "weather_code,wind_speed_10m,apparent_temperature",
                 "timezone": "auto",
-            }, timeout=30)
-            resp.raise_for_status()
-            data = resp.json()
+            }) as resp:
+                resp.raise_for_status()
+                data = await resp.json(loads=orjson.loads)
             break
-        except (requests.RequestException, requests.Timeout) as exc:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
             if attempt < retries - 1:
                 wait = 2 ** attempt
                 print(f"  ⚠️  Retry {attempt + 1}/{retries} for {name} after {wait}s: {exc}")
-                time.sleep(wait)
+                await asyncio.sleep(wait)
             else:
                 raise
 
-    current = data["current"]
-    uv = current["uv_index"]
+    return {
+        **_classify(data["current"]),
+        "timestamp": ts or datetime.now(timezone.utc).isoformat(),
+    }
 
-    if uv <= 2:
-        uv_desc = "Low"
-    elif uv <= 5:
-        uv_desc = "Moderate"
-    elif uv <= 7:
-        uv_desc = "High"
-    elif uv <= 10:
-        uv_desc = "Very High"
-    else:
-        uv_desc = "Extreme"
 
+def _classify(current: dict) -> dict:
+    """Build UV / weather fields from an Open-Meteo ``current`` block."""
+    uv = current["uv_index"]
     return {
         "uv_index":     uv,
-        "uv_desc":      uv_desc,
+        "uv_desc":      UV_LABELS[bisect.bisect_left(UV_BANDS, uv)],
         "temperature":  current["temperature_2m"],
         "feels_like":   current["apparent_temperature"],
         "humidity":     current["relative_humidity_2m"],
         "wind_speed":   current["wind_speed_10m"],
         "weather_desc": WMO_CODES.get(current.get("weather_code", -1), "Unknown"),
-        "timestamp":    datetime.now(timezone.utc).isoformat(),
     }
 
 
@@ -156,39 +278,91 @@ def fetch_uv(name: str, lat: float, lon: float, retries: int = 3) -> dict:
 # SUPABASE — upsert UV data
 # ============================================================
 
+def _uv_row(city_id: int, data: dict) -> dict:
+    """Build a uv_data row from fetched weather data."""
+    return {
+        "city_id":      city_id,
+        "uv_index":     data["uv_index"],
+        "uv_desc":      data["uv_desc"],
+        "temperature":  data["temperature"],
+        "feels_like":   data["feels_like"],
+        "humidity":     data["humidity"],
+        "wind_speed":   data["wind_speed"],
+        "weather_desc": data["weather_desc"],
+        "updated_at":   data["timestamp"],
+    }
+
+
 def upsert_uv_data(city_id: int, data: dict) -> None:
     """Upsert UV data for a city (one row per city, overwritten each time)."""
-    resp = requests.post(
-        f"{SUPABASE_URL}/rest/v1/uv_data?on_conflict=city_id",
-        headers={
-            **HEADERS,
-            "Prefer": "resolution=merge-duplicates",
-        },
-        json={
-            "city_id":      city_id,
-            "uv_index":     data["uv_index"],
-            "uv_desc":      data["uv_desc"],
-            "temperature":  data["temperature"],
-            "feels_like":   data["feels_like"],
-            "humidity":     data["humidity"],
-            "wind_speed":   data["wind_speed"],
-            "weather_desc": data["weather_desc"],
-            "updated_at":   data["timestamp"],
-        },
+    resp = _SESSION.post(
+        _UPSERT_URL,
+        headers=_UPSERT_HEADERS,
+        data=orjson.dumps(_uv_row(city_id, data)),
         timeout=15,
     )
     resp.raise_for_status()
 
 
+async def upsert_uv_data_async(session: aiohttp.ClientSession, city_id: int, data: dict) -> None:
+    """Async variant of upsert_uv_data for callers sharing an aiohttp session."""
+    async with session.post(
+        _UPSERT_URL,
+        headers=_UPSERT_HEADERS_FULL,
+        data=orjson.dumps(_uv_row(city_id, data)),
+        timeout=aiohttp.ClientTimeout(total=15),
+    ) as resp:
+        resp.raise_for_status()
+
+
+def upsert_uv_data_bulk(results: list[tuple[int, dict]]) -> None:
+    """Upsert UV data for many cities in a single request."""
+    resp = _SESSION.post(
+        _UPSERT_URL,
+        headers=_UPSERT_HEADERS,
+        data=orjson.dumps([_uv_row(city_id, data) for city_id, data in results]),
+        timeout=30,
+    )
+    resp.raise_for_status()
+
+
+async def get_uv(session: aiohttp.ClientSession, name: str) -> dict | None:
+    """Read stored UV data for an active city via get_uv_for_banner RPC."""
+    async with session.post(
+        _UV_RPC_URL,
+        headers=HEADERS,
+        data=orjson.dumps({"p_city": name}),
+        timeout=aiohttp.ClientTimeout(total=15),
+    ) as resp:
+        resp.raise_for_status()
+        data = await resp.json(loads=orjson.loads)
+    if not data.get("ok"):
+        return None
+    data["timestamp"] = data.pop("updated_at", None)
+    return data
+
+
 # ============================================================
 # MAIN
 # ============================================================
 
-def process_city(city: dict) -> dict:
-    """Fetch and save UV data for a single city. Returns weather data."""
-    data = fetch_uv(city["name"], city["lat"], city["lon"])
-    upsert_uv_data(city["id"], data)
-    return data
+async def process_city(session: aiohttp.ClientSession, sem: asyncio.Semaphore, city: dict,
+                       ts: str) -> dict:
+    """Fetch UV data for a single city. Returns weather data."""
+    async with sem:
+        return await fetch_uv(session, city["name"], city["lat"], city["lon"], ts=ts)
+
+
+async def process_cities(cities: list[dict]) -> list:
+    """Fetch all cities concurrently. Returns weather data or exception per city."""
+    sem = asyncio.Semaphore(CONCURRENCY)
+    # All rows of a batch share one sample timestamp
+    ts = datetime.now(timezone.utc).isoformat()
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+        return await asyncio.gather(
+            *(process_city(session, sem, city, ts) for city in cities),
+            return_exceptions=True,
+        )
 
 
 def main():
@@ -198,7 +372,8 @@ def main():
         sys.exit(1)
 
     # Single city mode: python uv_india.py "Mumbai"
-    if len(sys.argv) > 1:
+    single = len(sys.argv) > 1
+    if single:
         city_name = sys.argv[1]
         city = get_city_by_name(city_name)
         if not city:
@@ -219,16 +394,32 @@ def main():
     success_count = 0
     failed = []
 
-    for city in cities:
+    results = asyncio.run(process_cities(cities))
+
+    fetched = []
+    for city, data in zip(cities, results):
+        if isinstance(data, Exception):
+            print(f"  ❌ {city['name']:15s}  {data}")
+            failed.append(city["name"])
+        else:
+            fetched.append((city, data))
+
+    if fetched:
         try:
-            data = process_city(city)
-            country = city.get("country", "?")
-            print(f"  ✅ {city['name']:15s} ({country:12s})  UV {data['uv_index']:4.1f} ({data['uv_desc']:9s})  {data['temperature']}°C  {data['weather_desc']}")
-            success_count += 1
+            if single:
+                city, data = fetched[0]
+                upsert_uv_data(city["id"], data)
+            else:
+                upsert_uv_data_bulk([(city["id"], data) for city, data in fetched])
         except Exception as exc:
-            print(f"  ❌ {city['name']:15s}  {exc}")
-            failed.append(city["name"])
-        time.sleep(2)
+            print(f"  ❌ Supabase upsert failed: {exc}")
+            failed.extend(city["name"] for city, _ in fetched)
+            fetched = []
+
+    for city, data in fetched:
+        country = city.get("country", "?")
+        print(f"  ✅ {city['name']:15s} ({country:12s})  UV {data['uv_index']:4.1f} ({data['uv_desc']:9s})  {data['temperature']}°C  {data['weather_desc']}")
+        success_count += 1
 
     print("─" * 50)
     print(f"✅ Done: {success_count}/{len(cities)} cities updated")